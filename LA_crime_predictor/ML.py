@@ -7,17 +7,30 @@ Created on Sat Dec 11 14:09:42 2023
 
 # imports
 from LA_crime_predictor import crime_db as cd
+from LA_crime_predictor import profiling as prof
 import pandas as pd
 import numpy as np
 from datetime import time
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.metrics import accuracy_score
-from sklearn.preprocessing import LabelEncoder
+# sklearn is imported inside the functions that use it so importing this module stays cheap
 
 #Global Variables
-le_time = LabelEncoder()
-le_VictAge = LabelEncoder()
-le_risk = LabelEncoder()
+# the label encoders are created by _make_encoders on first use, since importing
+# sklearn also loads scipy
+le_time = None
+le_VictAge = None
+le_risk = None
+
+
+def _make_encoders():
+    '''
+    Creates the global label encoders the first time they are needed.
+    '''
+    global le_time, le_VictAge, le_risk
+    if le_time is None:
+        from sklearn.preprocessing import LabelEncoder
+        le_time = LabelEncoder()
+        le_VictAge = LabelEncoder()
+        le_risk = LabelEncoder()
 
 
 def Encode_Input(df):
@@ -33,10 +46,11 @@ def Encode_Input(df):
     -------
     a filtered pandas dataframe with all entries numerical
     '''
+    _make_encoders()
     #select following columns as trained inputs
     X= df[["Crime Period", "Vict Age Group", "LAT", "LON"]]
-    X["Crime Period"] = le_time.fit_transform(df["Crime Period"])
-    X["Vict Age Group"] = le_VictAge.fit_transform(df["Vict Age Group"])
+    X["Crime Period"] = cd.category_codes(df["Crime Period"], le_time)
+    X["Vict Age Group"] = cd.category_codes(df["Vict Age Group"], le_VictAge)
     return X
 
 
@@ -54,11 +68,24 @@ def Encode_Label(df):
     a filtered pandas dataframe with all entries numerical
     '''
 
+    _make_encoders()
     y = df[["Risk"]]
-    y["Risk"] = le_risk.fit_transform(y["Risk"])
+    y["Risk"] = cd.category_codes(y["Risk"], le_risk)
     return y
 
 
+def build_model():
+    '''
+    Builds the untrained model used by train_model.
+
+    Returns
+    -------
+    Random Forest Model of Depth 12
+    '''
+    from sklearn.ensemble import RandomForestClassifier
+    return RandomForestClassifier(max_depth=12)
+
+
 def train_model(year_begin, year_end, target_month):
     '''
     Takes in a beginning year and end year as integers, opens a database connection,
@@ -80,17 +107,18 @@ def train_model(year_begin, year_end, target_month):
     -------
     (Trained Random Forest Model of Depth 12, training score on the data)
     '''
-    df = cd.query_years(year_begin, year_end)
-    #get the month information and extract all the data that match the target_month
-    df["Month"] = df["DATE OCC"].str[0:2].astype(int)
+    df = cd.query_years(year_begin, year_end, compact=True)
+    #extract all the data that match the target_month
     train_df = df[df["Month"] == target_month]
     #transform categorical variables to numericals ones
-    X_train = Encode_Input(train_df)
-    y_train = Encode_Label(train_df)
+    with prof.span("encode"):
+        X_train = Encode_Input(train_df)
+        y_train = Encode_Label(train_df)
 
     #Establish our Model
-    forest = RandomForestClassifier(max_depth=12)
-    forest.fit(X_train, y_train)
+    forest = build_model()
+    with prof.span("fit"):
+        forest.fit(X_train, y_train)
 
     return forest, forest.score(X_train, y_train)
 
@@ -112,20 +140,131 @@ def test_model(clf, target_year, target_month):
     accuracy score when applied the model to the test data
     '''
 
-    df = cd.query_years(target_year, target_year)
-    #get the month information and extract all the data that match the target_month
-    df["Month"] = df["DATE OCC"].str[0:2].astype(int)
+    df = cd.query_years(target_year, target_year, compact=True)
+    #extract all the data that match the target_month
     test_df = df[df["Month"] == target_month]
 
     #transform categorical variables to numericals ones
-    X_test = Encode_Input(test_df)
-    y_test = Encode_Label(test_df)
+    with prof.span("encode"):
+        X_test = Encode_Input(test_df)
+        y_test = Encode_Label(test_df)
 
     y_true = y_test["Risk"]
-    y_pred = clf.predict(X_test)
+    with prof.span("predict"):
+        y_pred = clf.predict(X_test)
+    from sklearn.metrics import accuracy_score
     return accuracy_score(y_true, y_pred, normalize=True)
 
-    
+
+def _month_data(year, month):
+    '''
+    Queries a single month of crimes and encodes it for training.
+
+    Parameters
+    ----------
+    year: int, the year of the new data
+    month: int, the month of the new data
+
+    Returns
+    -------
+    (encoded inputs, encoded labels)
+    '''
+    df = cd.query_month(year, month, compact=True)
+    if len(df) == 0:
+        raise ValueError(f"no crimes found for {month:02d}/{year}")
+    with prof.span("encode"):
+        #the fixed vocabularies of compact results keep the codes the same across
+        #months, even if a month is missing one of the categories
+        X = Encode_Input(df)
+        y = Encode_Label(df)
+    return X, y
+
+
+def update_model(forest, year, month, n_new_trees=10, max_trees=None):
+    '''
+    Grows n_new_trees additional trees on one newly landed month of data instead of
+    retraining on the whole history. If max_trees is given, the oldest trees are
+    retired so the forest covers a sliding window of the most recent months.
+
+    Parameters
+    ----------
+    forest: a Random Forest Model trained with train_model (it is updated in place)
+    year: int, the year of the new data
+    month: int, the month of the new data
+    n_new_trees: int, number of trees fitted on the new data
+    max_trees: int, optional, the largest number of trees to keep
+
+    Note: the new month must contain every crime type, since trees fitted on fewer
+    classes cannot be averaged with the existing ones
+
+    Returns
+    -------
+    (Updated Random Forest Model, score of the updated model on the new data)
+    '''
+    X_new, y_new = _month_data(year, month)
+    if y_new["Risk"].nunique() != forest.n_classes_:
+        raise ValueError(f"{month:02d}/{year} does not contain every crime type, cannot update the forest")
+
+    #warm_start keeps the fitted trees and only fits the extra ones
+    forest.set_params(warm_start=True, n_estimators=len(forest.estimators_) + n_new_trees)
+    with prof.span("fit"):
+        forest.fit(X_new, y_new)
+
+    #retire the oldest trees, which were fitted on the oldest data
+    if max_trees is not None and len(forest.estimators_) > max_trees:
+        forest.estimators_ = forest.estimators_[-max_trees:]
+        forest.n_estimators = max_trees
+
+    return forest, forest.score(X_new, y_new)
+
+
+def train_streaming_model(year_begin, year_end, target_month):
+    '''
+    Trains a Gaussian Naive Bayes model one month at a time using partial_fit.
+    The model works with predict_crime_type like the Random Forest from train_model,
+    and update_streaming_model folds in new months at a cost that only depends on
+    the size of the new data.
+
+    Parameters
+    ----------
+    year_begin : int
+        the first year the user would like to query
+    year_end : int
+        the final year the user would like to query
+    target_month: int
+        the month the user would like to investigate
+
+    Returns
+    -------
+    Trained Gaussian Naive Bayes Model
+    '''
+    from sklearn.naive_bayes import GaussianNB
+    clf = GaussianNB()
+    for year in range(year_begin, year_end + 1):
+        clf = update_streaming_model(clf, year, target_month)
+    return clf
+
+
+def update_streaming_model(clf, year, month):
+    '''
+    Updates a model from train_streaming_model with one newly landed month of data.
+
+    Parameters
+    ----------
+    clf: a model trained with train_streaming_model (it is updated in place)
+    year: int, the year of the new data
+    month: int, the month of the new data
+
+    Returns
+    -------
+    the updated model
+    '''
+    X_new, y_new = _month_data(year, month)
+    with prof.span("fit"):
+        #all crime types are declared up front since a month may not contain every one
+        clf.partial_fit(X_new, y_new["Risk"], classes=np.arange(len(cd.RISKS)))
+    return clf
+
 
 def predict_crime_type(clf, crime_period, age_group, LAT, LON):
     '''
@@ -144,11 +283,14 @@ def predict_crime_type(clf, crime_period, age_group, LAT, LON):
     the predicted crime type to the user if there is any
     '''
 
-    data = {'Crime Period': [le_time.fit_transform(np.array([crime_period]))], 'Vict Age Group': [le_VictAge.fit_transform(np.array([age_group]))], 
+    _make_encoders()
+    #encode with the same fixed vocabularies the training data was encoded with
+    data = {'Crime Period': [le_time.fit(cd.CRIME_PERIODS).transform(np.array([crime_period]))], 'Vict Age Group': [le_VictAge.fit(cd.AGE_GROUPS).transform(np.array([age_group]))], 
             "LAT": [np.array([LAT])], "LON": [np.array([LON])]}
     
     X = pd.DataFrame.from_dict(data)
-    y_pred = clf.predict(X)
+    with prof.span("predict"):
+        y_pred = clf.predict(X)
     #map the y_pred to the crime_type using inverse_transform method
     return le_risk.inverse_transform(y_pred)
 
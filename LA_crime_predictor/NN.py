@@ -7,28 +7,33 @@ Created on Sat Dec 11 20:09:42 2023
 
 # imports
 from LA_crime_predictor import crime_db as cd
+from LA_crime_predictor import profiling as prof
 import numpy as np
 import pandas as pd
-import tensorflow as tf
-
-from tensorflow.keras import layers
-from tensorflow.keras import losses
-from tensorflow import keras
-from sklearn.preprocessing import LabelEncoder
+# tensorflow and sklearn are imported inside the functions that use them, since loading
+# them takes seconds and is not needed just to import this module
 
 
 
 #Global Variables
-le_time = LabelEncoder()
-le_VictAge = LabelEncoder()
-le_risk = LabelEncoder()
+# the label encoders are created by _make_encoders on first use, since importing
+# sklearn also loads scipy
+le_time = None
+le_VictAge = None
+le_risk = None
 scalars = ["Crime Period", "Vict Age Group", "LAT", "LON"]
 
-scalars_input = keras.Input(
-    shape = (len(scalars), ),
-    name = "scalars",
-    dtype = "float64"
-)
+
+def _make_encoders():
+    '''
+    Creates the global label encoders the first time they are needed.
+    '''
+    global le_time, le_VictAge, le_risk
+    if le_time is None:
+        from sklearn.preprocessing import LabelEncoder
+        le_time = LabelEncoder()
+        le_VictAge = LabelEncoder()
+        le_risk = LabelEncoder()
 
 
 def Encode_Df(df):
@@ -46,9 +51,10 @@ def Encode_Df(df):
     '''
     #select following columns as trained inputs
     #X= df[["Crime Period", "Vict Age Group", "LAT", "LON", "Risk"]]
-    df["Crime Period"] = le_time.fit_transform(df["Crime Period"])
-    df["Vict Age Group"] = le_VictAge.fit_transform(df["Vict Age Group"])
-    df["Risk"] = le_risk.fit_transform(df["Risk"])
+    _make_encoders()
+    df["Crime Period"] = cd.category_codes(df["Crime Period"], le_time)
+    df["Vict Age Group"] = cd.category_codes(df["Vict Age Group"], le_VictAge)
+    df["Risk"] = cd.category_codes(df["Risk"], le_risk)
     return df
 
 
@@ -64,6 +70,7 @@ def Make_Data(df):
     -------
     a TensorFlow dataset
     '''
+    import tensorflow as tf
 
     data = tf.data.Dataset.from_tensor_slices(
         (
@@ -81,45 +88,25 @@ def Make_Data(df):
 
 
 
-def train_model(year_begin, year_end, target_month):
+def build_model():
     '''
-    Takes in a beginning year and end year as integers, opens a database connection,
-    returns a trained NN model that fits the data.
-    We will only look at data with the same month as the target_month.
-
-    The Returned Model aims to predict the type of crime given "Crime Period", "Vict Age Group","LAT", "LON" as input
-
-    Parameters
-    ----------
-    year_begin : int
-        the first year the user would like to query
-    year_end : int
-        the final year the user would like to query
-    target_month: int
-        the month the user would like to investigate
+    Builds and compiles the untrained NN model used by train_model
+    (Convolution -> Maxpooling -> LSTM -> Dense).
 
     Returns
     -------
-    (Trained NN model, training history of the model)
+    compiled keras model taking the scalars as input and predicting the crime type
     '''
-    df = cd.query_years(year_begin, year_end)
-    #get the month information and extract all the data that match the target_month
-    df["Month"] = df["DATE OCC"].str[0:2].astype(int)
-    train_df = df[df["Month"] == target_month]
-    #transform categorical variables to numericals ones
-    filt_train_df = Encode_Df(train_df)
-    data = Make_Data(filt_train_df)
-
-    data = data.shuffle(buffer_size = len(data), reshuffle_each_iteration=False)
+    from tensorflow.keras import layers
+    from tensorflow.keras import losses
+    from tensorflow import keras
 
-    train_size = int(0.9*len(data))
-    val_size   = int(0.1*len(data))
-    #run SGD on sample of 100
-    train = data.take(train_size).batch(50)
-    val   = data.skip(train_size).take(val_size).batch(50)
-
-    
     #Define Layers of the Model
+    scalars_input = keras.Input(
+        shape = (len(scalars), ),
+        name = "scalars",
+        dtype = "float64"
+    )
     scalar_features = layers.Reshape((len(scalars), 1), input_shape=(len(scalars),))(scalars_input)
 
     scalar_features = layers.Conv1D(filters = 18, kernel_size=3, activation='relu')(scalar_features)
@@ -148,11 +135,73 @@ def train_model(year_begin, year_end, target_month):
               loss = losses.SparseCategoricalCrossentropy(from_logits=True),
               metrics=['accuracy']
     )
+    return model
+
+
+def fit_data(model, data, epochs=50, verbose=True):
+    '''
+    Shuffles a dataset made by Make_Data, holds out 10% of it for validation and
+    fits the model on the rest in batches of 50.
+
+    Parameters
+    ----------
+    model: a compiled model from build_model
+    data: TensorFlow dataset from Make_Data
+    epochs: int, number of passes over the training data
+    verbose: bool, whether keras prints progress
+
+    Returns
+    -------
+    training history of the model
+    '''
+    data = data.shuffle(buffer_size = len(data), reshuffle_each_iteration=False)
+
+    train_size = int(0.9*len(data))
+    val_size   = int(0.1*len(data))
+    #run SGD on sample of 100
+    train = data.take(train_size).batch(50)
+    val   = data.skip(train_size).take(val_size).batch(50)
+
     #Fit the Model
-    history = model.fit(train,
-                    validation_data=val,
-                    epochs = 50,
-                    verbose = True)
+    with prof.span("fit"):
+        history = model.fit(train,
+                        validation_data=val,
+                        epochs = epochs,
+                        verbose = verbose)
+    return history
+
+
+def train_model(year_begin, year_end, target_month):
+    '''
+    Takes in a beginning year and end year as integers, opens a database connection,
+    returns a trained NN model that fits the data.
+    We will only look at data with the same month as the target_month.
+
+    The Returned Model aims to predict the type of crime given "Crime Period", "Vict Age Group","LAT", "LON" as input
+
+    Parameters
+    ----------
+    year_begin : int
+        the first year the user would like to query
+    year_end : int
+        the final year the user would like to query
+    target_month: int
+        the month the user would like to investigate
+
+    Returns
+    -------
+    (Trained NN model, training history of the model)
+    '''
+    df = cd.query_years(year_begin, year_end, compact=True)
+    #extract all the data that match the target_month
+    train_df = df[df["Month"] == target_month]
+    #transform categorical variables to numericals ones
+    with prof.span("encode"):
+        filt_train_df = Encode_Df(train_df)
+        data = Make_Data(filt_train_df)
+
+    model = build_model()
+    history = fit_data(model, data)
     
     return model, history 
 
@@ -175,15 +224,16 @@ def test_model(clf, target_year, target_month):
     accuracy score when applied the model to the test data
     '''
 
-    df = cd.query_years(target_year, target_year)
+    df = cd.query_years(target_year, target_year, compact=True)
 
-    #get the month information and extract all the data that match the target_month
-    df["Month"] = df["DATE OCC"].str[0:2].astype(int)
+    #extract all the data that match the target_month
     test_df = df[df["Month"] == target_month]
 
     #transform categorical variables to numericals ones and obtain the test data
-    filt_test_df = Encode_Df(test_df)
-    test_data = Make_Data(filt_test_df)
+    with prof.span("encode"):
+        filt_test_df = Encode_Df(test_df)
+        test_data = Make_Data(filt_test_df)
     #batch the test data
     test = test_data.batch(100)
-    return clf.evaluate(test)
\ No newline at end of file
+    with prof.span("predict"):
+        return clf.evaluate(test)
\ No newline at end of file
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""
+Rolling backtest of the ML and NN crime type models.
+
+The data is queried once, then for every test year N and month the model is
+trained on years N-window..N-1 of that month and tested on year N. Folds run in
+parallel on a process pool and the results come back as one table.
+
+Example (from the repository root):
+    python -m LA_crime_predictor.backtest 2015 2023 --window 3 --model ml
+"""
+
+# imports
+import os
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from LA_crime_predictor import crime_db as cd
+
+#Global Variables
+features = ["Crime Period", "Vict Age Group", "LAT", "LON"]
+
+
+def _encode(df):
+    '''
+    Takes in a compact dataframe and returns the model inputs and the "Risk" label as
+    integer codes of the fixed vocabularies (the same codes ML and NN train on).
+    '''
+    encoded = df[features + ["Risk"]].copy()
+    for column in ["Crime Period", "Vict Age Group", "Risk"]:
+        encoded[column] = cd.category_codes(df[column])
+    return encoded
+
+
+def make_folds(df, first_year, last_year, window, months=range(1, 13)):
+    '''
+    Takes in a compact dataframe covering first_year-window..last_year and splits it
+    into rolling train/test folds.
+
+    Parameters
+    ----------
+    df
+        compact dataframe returned by crime_db.query_years(..., compact=True)
+    first_year : int
+        the first year to test on
+    last_year : int
+        the last year to test on
+    window : int
+        number of years before the test year used for training
+    months : iterable of int
+        the months to build folds for
+
+    Returns
+    -------
+    list of (year, month, encoded training dataframe, encoded test dataframe)
+    '''
+    folds = []
+    for year in range(first_year, last_year + 1):
+        in_window = (df["year"] >= year - window) & (df["year"] <= year - 1)
+        in_test = df["year"] == year
+        for month in months:
+            same_month = df["Month"] == month
+            train_df = df[in_window & same_month]
+            test_df = df[in_test & same_month]
+            if len(train_df) == 0 or len(test_df) == 0: # e.g. months of 2023 not yet reported
+                continue
+            folds.append((year, month, _encode(train_df), _encode(test_df)))
+    return folds
+
+
+def _init_worker(model, threads):
+    '''
+    Caps TensorFlow's thread pools in each worker process so the workers together do
+    not oversubscribe the CPUs.
+    '''
+    if model == "nn":
+        import tensorflow as tf
+        tf.config.threading.set_intra_op_parallelism_threads(threads)
+        tf.config.threading.set_inter_op_parallelism_threads(1)
+
+
+def _fit_predict(model, train_df, test_df, epochs):
+    '''
+    Trains the requested model on one fold the same way ML.train_model and NN.train_model
+    do, and predicts its test set.
+
+    Returns
+    -------
+    (predictions, seconds spent fitting, seconds spent predicting)
+    '''
+    start = time.perf_counter()
+    if model == "ml":
+        from LA_crime_predictor import ML
+        clf = ML.build_model()
+        clf.fit(train_df[features], train_df["Risk"])
+        fit_time = time.perf_counter() - start
+        start = time.perf_counter()
+        y_pred = clf.predict(test_df[features])
+    elif model == "nn":
+        from LA_crime_predictor import NN
+        clf = NN.build_model()
+        NN.fit_data(clf, NN.Make_Data(train_df), epochs=epochs, verbose=False)
+        fit_time = time.perf_counter() - start
+        start = time.perf_counter()
+        y_pred = clf.predict(NN.Make_Data(test_df).batch(100), verbose=0).argmax(axis=1)
+    else:
+        raise ValueError(f"unknown model {model!r}, expected 'ml' or 'nn'")
+    return y_pred, fit_time, time.perf_counter() - start
+
+
+def _run_fold(model, epochs, fold):
+    '''
+    Runs a single fold in a worker process and returns one row of the results table.
+    '''
+    from sklearn.metrics import accuracy_score, precision_recall_fscore_support
+    year, month, train_df, test_df = fold
+    y_pred, fit_time, predict_time = _fit_predict(model, train_df, test_df, epochs)
+    y_train = train_df["Risk"]
+    y_test = test_df["Risk"]
+
+    labels = np.arange(len(cd.RISKS))
+    precision, recall, _, _ = precision_recall_fscore_support(y_test, y_pred, labels=labels,
+                                                              zero_division=0)
+    row = {"model": model, "year": year, "month": month,
+           "n_train": len(y_train), "n_test": len(y_test),
+           "accuracy": accuracy_score(y_test, y_pred)}
+    for i, risk in enumerate(cd.RISKS):
+        row[f"precision {risk}"] = precision[i]
+        row[f"recall {risk}"] = recall[i]
+    row["fit_seconds"] = fit_time
+    row["predict_seconds"] = predict_time
+    return row
+
+
+def backtest(first_year, last_year, window=3, model="ml", months=range(1, 13),
+             workers=None, epochs=50):
+    '''
+    Runs a rolling backtest: for every year N from first_year to last_year and every month,
+    trains on years N-window..N-1 of that month and tests on year N. The database is
+    queried once and the folds run in parallel.
+
+    Parameters
+    ----------
+    first_year : int
+        the first year to test on
+    last_year : int
+        the last year to test on
+    window : int
+        number of years before the test year used for training
+    model : str
+        "ml" for the Random Forest of depth 12, "nn" for the neural network
+    months : iterable of int
+        the months to test
+    workers : int, optional
+        number of worker processes, defaults to the number of CPUs for "ml" and a
+        quarter of them for "nn", whose workers each get a share of the CPUs for
+        TensorFlow; 1 runs the folds in this process
+    epochs : int
+        training epochs for the neural network
+
+    Returns
+    -------
+    df
+        one row per fold with accuracy, per-class precision and recall, fold sizes
+        and fit/predict timings in seconds
+    '''
+    df = cd.query_years(first_year - window, last_year, compact=True)
+    df = df[["year", "Month", "Risk"] + features]
+    folds = make_folds(df, first_year, last_year, window, months)
+
+    cpus = os.cpu_count() or 1
+    if workers is None:
+        workers = cpus if model == "ml" else max(1, cpus // 4)
+
+    if workers == 1:
+        rows = [_run_fold(model, epochs, fold) for fold in folds]
+    else:
+        threads = max(1, cpus // workers)
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(model, threads)) as pool:
+            rows = list(pool.map(_run_fold, [model] * len(folds), [epochs] * len(folds), folds))
+
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rolling backtest of the crime type models")
+    parser.add_argument("first_year", type=int, help="first year to test on")
+    parser.add_argument("last_year", type=int, help="last year to test on")
+    parser.add_argument("--window", type=int, default=3, help="years of training data per fold")
+    parser.add_argument("--model", choices=["ml", "nn"], default="ml")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes")
+    parser.add_argument("--epochs", type=int, default=50, help="training epochs for the nn model")
+    args = parser.parse_args()
+
+    results = backtest(args.first_year, args.last_year, args.window, args.model,
+                       workers=args.workers, epochs=args.epochs)
+    with pd.option_context("display.max_rows", None, "display.width", 200):
+        print(results.to_string(index=False))
+        print()
+        print(results.drop(columns=["model", "year", "month"]).mean().to_string())
@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""
+Asyncio versions of the crime_db, crime_prob and ML entry points for use in an
+async web service.
+
+SQLite queries and model predictions run on a bounded thread pool, geocoding is
+limited to a few concurrent requests, and concurrent calls for the same address
+share a single in-flight geocode and query.
+"""
+
+# imports
+import asyncio
+import contextvars
+import functools
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from LA_crime_predictor import crime_db as cd
+from LA_crime_predictor import crime_prob as cp
+
+#Global Variables
+max_workers = 8 # threads available for SQLite queries and predictions
+geocode_concurrency = 2 # geocoding requests allowed in flight at once (Nominatim is rate limited)
+
+_executor = None
+_geocode_limits = weakref.WeakKeyDictionary() # event loop -> asyncio.Semaphore
+_inflight = weakref.WeakKeyDictionary() # event loop -> {key: asyncio.Task}
+
+
+def configure(workers=None, geocodes=None):
+    '''
+    Changes the size of the thread pool and/or the geocoding concurrency limit.
+    Takes effect for work submitted afterwards.
+
+    Parameters
+    ----------
+    workers : int, optional
+        number of threads used for SQLite queries and predictions
+    geocodes : int, optional
+        number of geocoding requests allowed in flight at once
+    '''
+    global max_workers, geocode_concurrency, _executor
+    if workers is not None:
+        max_workers = workers
+        if _executor is not None:
+            _executor.shutdown(wait=False)
+            _executor = None
+    if geocodes is not None:
+        geocode_concurrency = geocodes
+        _geocode_limits.clear()
+
+
+def _run(func, *args):
+    '''
+    Runs a blocking function on the shared thread pool and returns an awaitable for its result.
+    The caller's context is copied into the thread so an active profiling.profile() block
+    records the work.
+    '''
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="crime")
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    return loop.run_in_executor(_executor, functools.partial(ctx.run, func, *args))
+
+
+async def _coalesce(key, make_coro):
+    '''
+    Awaits the in-flight task for key, starting it with make_coro() if there is none.
+    Cancelling one caller only stops its own wait; the shared task is cancelled once
+    every caller waiting on it has been cancelled.
+
+    Parameters
+    ----------
+    key : tuple
+        identifies the request, callers with equal keys share one task
+    make_coro : function
+        called with no arguments to create the coroutine for a new task
+
+    Returns
+    -------
+    the result of the shared task
+    '''
+    tasks = _inflight.setdefault(asyncio.get_running_loop(), {})
+    task = tasks.get(key)
+    if task is None:
+        task = asyncio.ensure_future(make_coro())
+        task.waiters = 0
+        tasks[key] = task
+        task.add_done_callback(lambda t: tasks.pop(key, None) if tasks.get(key) is t else None)
+    task.waiters += 1
+    try:
+        return await asyncio.shield(task)
+    except asyncio.CancelledError:
+        if not task.done() and task.waiters == 1:
+            tasks.pop(key, None) # later callers start a fresh request
+            task.cancel()
+        raise
+    finally:
+        task.waiters -= 1
+
+
+async def geocode_async(address):
+    '''
+    Async version of crime_db.geocode. At most geocode_concurrency lookups run at once
+    and concurrent lookups of the same address share one request.
+
+    Parameters
+    ----------
+    address : str
+        address the user would like to search around
+
+    Returns
+    -------
+    (float, float)
+        latitude and longitude of the address
+    '''
+    async def lookup():
+        loop = asyncio.get_running_loop()
+        limit = _geocode_limits.get(loop)
+        if limit is None:
+            limit = _geocode_limits[loop] = asyncio.Semaphore(geocode_concurrency)
+        async with limit:
+            return await _run(cd.geocode, address)
+
+    return await _coalesce(("geocode", cd.normalize_address(address)), lookup)
+
+
+async def query_address_async(address):
+    '''
+    Async version of crime_db.query_address. Concurrent calls for the same address
+    share one geocode and one query.
+
+    Parameters
+    ----------
+    address : str
+        address the user would like to search around
+
+    Returns
+    -------
+    df
+        dataframe of all crimes committed near the given address from 2021-2022
+    '''
+    df = await _shared_query(address)
+    return df.copy() # every caller gets its own frame since the result is shared
+
+
+def _shared_query(address):
+    async def query():
+        lat, lon = await geocode_async(address)
+        return await _run(cd.query_coords, lat, lon)
+
+    return _coalesce(("address", cd.normalize_address(address)), query)
+
+
+async def calc_lambda_async(address):
+    '''
+    Async version of crime_prob.calc_lambda.
+
+    Parameters
+    ----------
+    address : str
+        The street address the user would like to search around for crimes
+
+    Returns
+    -------
+    l : float
+        the average number of crimes occurring in the area per day
+    '''
+    async def compute():
+        return cp.lambda_from_df(await _shared_query(address))
+
+    return await _coalesce(("lambda", cd.normalize_address(address)), compute)
+
+
+async def predict_crime_type_async(clf, crime_period, age_group, LAT, LON):
+    '''
+    Async version of ML.predict_crime_type, run on the thread pool so the prediction
+    does not block the event loop.
+
+    Parameters
+    ----------
+    clf: a ML model that you just finished training by using ML.train_model
+    crime_period: string, the current period of the day the user is in
+    age_group: string, the age group the user belongs to
+    LAT: float, the current latitude of the user
+    LON: float, the current longitude of the user
+
+    Returns
+    -------
+    the predicted crime type to the user if there is any
+    '''
+    from LA_crime_predictor import ML
+    return await _run(ML.predict_crime_type, clf, crime_period, age_group, LAT, LON)
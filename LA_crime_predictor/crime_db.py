@@ -10,7 +10,26 @@ import pandas as pd
 import numpy as np
 import sqlite3
 from datetime import time
-from geopy.geocoders import Nominatim
+from functools import lru_cache
+from LA_crime_predictor import profiling as prof
+from LA_crime_predictor import query_cache as qc
+
+#Global Variables
+db_path = "LA Crime Database.db"
+
+# fixed vocabularies for the categorical columns of compact query results, in sorted
+# order so that category codes match what a LabelEncoder fitted on them produces
+CRIME_PERIODS = ["afternoon", "evening", "morning", "night"]
+AGE_GROUPS = ["adult", "child", "older adult", "senior", "young adult"]
+RISKS = ["Light", "Medium", "Serious"]
+SEXES = ["Female", "Male", "Unknown"]
+AREA_NAMES = ["77th Street", "Central", "Devonshire", "Foothill", "Harbor", "Hollenbeck",
+              "Hollywood", "Mission", "N Hollywood", "Newton", "Northeast", "Olympic",
+              "Pacific", "Rampart", "Southeast", "Southwest", "Topanga", "Van Nuys",
+              "West LA", "West Valley", "Wilshire"]
+# "Crm Cd Desc" has too many values to list here, its vocabulary is read from the
+# database by crime_descriptions and kept per ingest generation
+_descriptions = {} # generation -> sorted list of crime descriptions
 
 class _classify: #classification functions used in df preparation for creating the database
 
@@ -107,7 +126,7 @@ def create_db():
     connection.
     '''
     # opens the database connection
-    conn = sqlite3.connect("LA Crime Database.db")
+    conn = sqlite3.connect(db_path)
     
     # df preparation columns
     col = ["DATE OCC", "TIME OCC", "AREA NAME", "Crm Cd", "Crm Cd Desc", 
@@ -156,35 +175,267 @@ def create_db():
         for df in df_iter:
             df = prepare_df(df)
             df.to_sql("crimes", conn, if_exists = "append", index = False)
+    
+    create_indexes(conn)
+    
+    # bumps the ingest generation so cached query results are invalidated
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    conn.execute(f"PRAGMA user_version = {version + 1}")
+    conn.commit()
             
     # closes the database connection
     conn.close()
 
-def query_address(address): # within one hundredth of a degree, lat/lon
+def create_indexes(conn):
+    '''
+    Creates the indexes used by the queries below on an open database connection, so
+    year and single-month queries (see query_month) only read the matching rows instead
+    of scanning the whole table. Safe to call on an existing database.
+
+    Parameters
+    ----------
+    conn : sqlite3.Connection
+        open database connection
+    '''
+    # the month expression must match the one used in query_month for the index to apply
+    conn.execute('CREATE INDEX IF NOT EXISTS crimes_year_month ON crimes (year, substr("DATE OCC", 1, 2))')
+    # lets crime_descriptions read the distinct descriptions from the index
+    conn.execute('CREATE INDEX IF NOT EXISTS crimes_desc ON crimes ("Crm Cd Desc")')
+    conn.commit()
+
+def _read_sql(cmd, conn):
+    '''
+    Runs a query with pandas and, when profiling is enabled, records the query plan,
+    the rows returned and the SQLite VM steps used under the "query" and "decode" spans.
+
+    Parameters
+    ----------
+    cmd : str
+        SQL statement
+    conn : sqlite3.Connection
+        open database connection
+
+    Returns
+    -------
+    df
+        result of the query
+    '''
+    if not prof.enabled():
+        return pd.read_sql_query(cmd, conn)
+
+    steps = [0]
+    def count_steps():
+        steps[0] += 1000
+        return 0
+    conn.set_progress_handler(count_steps, 1000)
+    try:
+        with prof.span("query"):
+            cursor = conn.execute(cmd)
+            rows = cursor.fetchall()
+    finally:
+        conn.set_progress_handler(None, 1000)
+    with prof.span("decode"): # building the dataframe from the fetched rows
+        df = pd.DataFrame.from_records(rows, columns=[c[0] for c in cursor.description])
+    prof.record_query(conn, cmd, len(df), steps[0])
+    return df
+
+def _as_category(col, vocab):
+    '''
+    Converts a column to a pandas category dtype whose categories are the fixed vocabulary
+    plus any value missing from it, kept in sorted order.
+    '''
+    categories = sorted(set(vocab).union(col.dropna().unique()))
+    return col.astype(pd.CategoricalDtype(categories))
+
+def crime_descriptions():
+    '''
+    Returns the vocabulary of the "Crm Cd Desc" column: every distinct description in
+    the database, read once per ingest generation so all compact results share it.
+
+    Returns
+    -------
+    list of str
+        sorted crime descriptions
+    '''
+    gen = qc.generation(db_path)
+    vocab = _descriptions.get(gen)
+    if vocab is None:
+        conn = sqlite3.connect(db_path)
+        rows = conn.execute('SELECT DISTINCT "Crm Cd Desc" FROM crimes WHERE "Crm Cd Desc" IS NOT NULL').fetchall()
+        conn.close()
+        vocab = sorted(row[0] for row in rows)
+        _descriptions.clear() # only the current generation is worth keeping
+        _descriptions[gen] = vocab
+    return vocab
+
+def category_codes(col, le=None):
     '''
-    Takes in an address as a string, opens a database connection, converts the address 
-    to its latitude and longitude coordinates using the geopy library, returns 
-    a dataframe containing all crimes that occurred near the address from 2021-2022,
-    and finally closes the database connection.
+    Takes in a column and returns it as integer codes for the models. Category columns
+    from compact queries already carry codes from their fixed vocabulary, so these are
+    used directly and the label encoder, if given, is fitted on the vocabulary. Because
+    the vocabularies are sorted, the codes are the ones the encoder itself would produce.
+    Other columns are encoded with the label encoder.
+
+    Parameters
+    ----------
+    col : pandas series
+        column to encode
+    le : sklearn LabelEncoder, optional
+        encoder to fit, needed to decode predictions later; required for non-category columns
+
+    Returns
+    -------
+    numpy array
+        integer codes of the column
+    '''
+    if isinstance(col.dtype, pd.CategoricalDtype):
+        if le is not None:
+            le.fit(col.cat.categories)
+        return col.cat.codes.to_numpy()
+    return le.fit_transform(col)
+
+def compact(df):
+    '''
+    Takes in a dataframe returned by a query and converts it to compact dtypes: the
+    categorical columns become pandas categories backed by the fixed vocabularies above,
+    year and the new "Month" column become small integers, LAT/LON become float32,
+    "DATE OCC" becomes a datetime and "TIME OCC" a timedelta since midnight.
+    "LOCATION" is the only category column without a shared vocabulary: its categories
+    come from the result itself, so frames from different queries should be combined
+    with union_categoricals rather than pd.concat to keep it categorical.
+
+    Parameters
+    ----------
+    df
+        dataframe with the columns of the crimes table
+
+    Returns
+    -------
+    df
+        the same data using a fraction of the memory
+    '''
+    df = df.copy()
+    date = df["DATE OCC"].str[0:10] # "MM/DD/YYYY", the time part is always midnight
+    df["DATE OCC"] = pd.to_datetime(date, format="%m/%d/%Y")
+    df["TIME OCC"] = pd.to_timedelta(df["TIME OCC"])
+    df["year"] = df["year"].astype(np.int16)
+    df["Month"] = df["DATE OCC"].dt.month.astype(np.int8)
+    df["LAT"] = df["LAT"].astype(np.float32)
+    df["LON"] = df["LON"].astype(np.float32)
+    df["Crm Cd"] = pd.to_numeric(df["Crm Cd"], downcast="integer")
+    df["Vict Age"] = pd.to_numeric(df["Vict Age"], downcast="integer")
+    
+    for column, vocab in [("Crime Period", CRIME_PERIODS), ("Vict Age Group", AGE_GROUPS),
+                          ("Risk", RISKS), ("Vict Sex", SEXES), ("AREA NAME", AREA_NAMES),
+                          ("Crm Cd Desc", crime_descriptions()), ("LOCATION", [])]:
+        df[column] = _as_category(df[column], vocab)
+    
+    return df
+
+def _query(cmd, key, cache, compact_result=False):
+    '''
+    Runs a query against the database, going through query_cache when cache is True.
+
+    Parameters
+    ----------
+    cmd : str
+        SQL statement
+    key : tuple
+        normalized form of the query (table, year range, bounding box, columns and,
+        for single-month queries, the month)
+    cache : bool
+        whether to use query_cache
+    compact_result : bool
+        whether to convert the result with compact()
+
+    Returns
+    -------
+    df
+        result of the query
+    '''
+    def run():
+        conn = sqlite3.connect(db_path)
+        df = _read_sql(cmd, conn)
+        conn.close()
+        if compact_result:
+            df = compact(df)
+        return df
+
+    if not cache:
+        return run()
+    if compact_result: # compact results are cached separately, at their smaller size
+        key = key + ("compact",)
+    return qc.cached_query(key, db_path, run)
+
+def geocode(address):
+    '''
+    Takes in an address as a string and converts it to its latitude and longitude
+    coordinates using the geopy library. Results are remembered per address (ignoring
+    case and extra whitespace), so repeated lookups skip the network request.
+
+    Parameters
+    ----------
+    address : str
+        address the user would like to search around
+
+    Returns
+    -------
+    (float, float)
+        latitude and longitude of the address
+    '''
+    return _geocode(normalize_address(address))
+
+def normalize_address(address):
+    '''
+    Takes in an address as a string and returns it lower-cased with runs of whitespace
+    collapsed. Used as the key for remembered geocoding results and for sharing
+    in-flight requests in crime_async.
 
     Parameters
     ----------
     address : str
         address the user would like to search around
 
+    Returns
+    -------
+    str
+        normalized address
+    '''
+    return " ".join(address.lower().split())
+
+@lru_cache(maxsize=4096)
+def _geocode(address):
+    from geopy.geocoders import Nominatim # only needed for address lookups
+    with prof.span("geocode"):
+        loc = Nominatim(user_agent="Geopy Library")
+        getLoc = loc.geocode(address)
+    return getLoc.latitude, getLoc.longitude
+
+def query_coords(lat, lon, cache=True, compact=False): # within one hundredth of a degree, lat/lon
+    '''
+    Takes in latitude and longitude coordinates, opens a database connection, returns
+    a dataframe containing all crimes that occurred near the coordinates from 2021-2022,
+    and finally closes the database connection. Results are served from query_cache
+    unless the database has changed since they were cached.
+
+    Parameters
+    ----------
+    lat : float
+        latitude the user would like to search around
+    lon : float
+        longitude the user would like to search around
+    cache : bool
+        set to False to always run the query against the database
+    compact : bool
+        set to True to get the result with compact dtypes (see the compact function)
+
     Returns
     -------
     df
-        dataframe of all crimes committed near the given address from 2021-2022
+        dataframe of all crimes committed near the given coordinates from 2021-2022
     '''
     
-    conn = sqlite3.connect("LA Crime Database.db")
-    
-    loc = Nominatim(user_agent="Geopy Library")
-    getLoc = loc.geocode(address)
-    lat = getLoc.latitude
     lat_min, lat_max = (lat-.01), (lat +.01) # sets the latitude search range 
-    lon = getLoc.longitude
     lon_min, lon_max = (lon-.01), (lon+.01) # sets the longitude search range
     
     year_begin = 2021 # we only want to use recent data for accurate predictions
@@ -196,17 +447,38 @@ def query_address(address): # within one hundredth of a degree, lat/lon
     FROM crimes C
     WHERE C.year <= {year_end} AND C.year >= {year_begin} AND C.LAT >= {lat_min} AND C.LAT <= {lat_max} AND C.LON >= {lon_min} AND C.LON <= {lon_max}
     """
-    df = pd.read_sql_query(cmd, conn)
-    conn.close()
-    
-    return df
+    bbox = tuple(round(v, 6) for v in (lat_min, lat_max, lon_min, lon_max))
+    key = ("crimes", year_begin, year_end, bbox, "*")
+    return _query(cmd, key, cache, compact)
 
+def query_address(address, compact=False): # within one hundredth of a degree, lat/lon
+    '''
+    Takes in an address as a string, converts the address to its latitude and longitude
+    coordinates using the geopy library, and returns a dataframe containing all crimes
+    that occurred near the address from 2021-2022.
+
+    Parameters
+    ----------
+    address : str
+        address the user would like to search around
+    compact : bool
+        set to True to get the result with compact dtypes (see the compact function)
 
-def query_years(year_begin, year_end):
+    Returns
+    -------
+    df
+        dataframe of all crimes committed near the given address from 2021-2022
+    '''
+    lat, lon = geocode(address)
+    return query_coords(lat, lon, compact=compact)
+
+
+def query_years(year_begin, year_end, cache=True, compact=False):
     '''
     Takes in a beginning year and end year as integers, opens a database connection,
     returns a dataframe of all crimes that occurred during and between the start and
-    end years, then closes the databse connection.
+    end years, then closes the databse connection. Results are served from query_cache
+    unless the database has changed since they were cached.
 
     Parameters
     ----------
@@ -214,6 +486,10 @@ def query_years(year_begin, year_end):
         the first year the user would like to query
     year_end : int
         the final year the user would like to query
+    cache : bool
+        set to False to always run the query against the database
+    compact : bool
+        set to True to get the result with compact dtypes (see the compact function)
 
     Returns
     -------
@@ -221,15 +497,43 @@ def query_years(year_begin, year_end):
         dataframe of all crimes committed during and between the given years
     '''
     
-    conn = sqlite3.connect("LA Crime Database.db")
-    
     cmd = \
     f"""
     SELECT *
     FROM crimes C
     WHERE C.year <= {year_end} AND C.year >= {year_begin}
     """
-    df = pd.read_sql_query(cmd, conn)
-    conn.close()
+    key = ("crimes", int(year_begin), int(year_end), None, "*")
+    return _query(cmd, key, cache, compact)
+
+def query_month(year, month, cache=True, compact=False):
+    '''
+    Takes in a year and a month as integers and returns a dataframe of all crimes that
+    occurred in that month. Used to pull just the newly landed data when updating a model.
+    The crimes_year_month index (see create_indexes) keeps this from scanning the table.
+
+    Parameters
+    ----------
+    year : int
+        the year the user would like to query
+    month : int
+        the month the user would like to query (1-12)
+    cache : bool
+        set to False to always run the query against the database
+    compact : bool
+        set to True to get the result with compact dtypes (see the compact function)
+
+    Returns
+    -------
+    df
+        dataframe of all crimes committed in the given month
+    '''
     
-    return df
\ No newline at end of file
+    cmd = \
+    f"""
+    SELECT *
+    FROM crimes C
+    WHERE C.year = {int(year)} AND substr(C."DATE OCC", 1, 2) = '{int(month):02d}'
+    """
+    key = ("crimes", int(year), int(year), None, "*", int(month))
+    return _query(cmd, key, cache, compact)
\ No newline at end of file
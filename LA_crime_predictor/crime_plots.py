@@ -7,9 +7,8 @@ Created on Mon Dec 11 20:52:11 2023
 
 from LA_crime_predictor import crime_db as cdb
 import pandas as pd
-from matplotlib import pyplot as plt
-import plotly.express as px
-import seaborn as sns
+# matplotlib, plotly and seaborn are imported inside each plotting function so that
+# importing this module stays cheap
 
 def crime_count_year(year_begin,year_end):
     '''
@@ -28,7 +27,8 @@ def crime_count_year(year_begin,year_end):
     None.
 
     '''
-    df = cdb.query_years(year_begin, year_end)
+    from matplotlib import pyplot as plt
+    df = cdb.query_years(year_begin, year_end, compact=True)
     # creates a new grouped dataframe for counting purposes
     crime_num = df.groupby("year")["Vict Age"].agg(len).reset_index() 
     crime_num.rename(columns = {"Vict Age" : "Crime Count"}, inplace = True)
@@ -58,7 +58,9 @@ def crime_count_period(year_begin,year_end):
     None.
 
     '''
-    df = cdb.query_years(year_begin, year_end)
+    from matplotlib import pyplot as plt
+    import seaborn as sns
+    df = cdb.query_years(year_begin, year_end, compact=True)
     
     # here we set the x-axis of our plot and set each bar's color to correspond to a crime period
     sns.countplot(df, x="year", hue="Crime Period")
@@ -84,9 +86,11 @@ def crime_count_age(year_begin,year_end):
     None.
 
     '''
-    df = cdb.query_years(year_begin, year_end)
+    import plotly.express as px
+    df = cdb.query_years(year_begin, year_end, compact=True)
     # creates a new grouped dataframe for counting purposes
-    agegroup_num = df.groupby(["year","Vict Age Group"])["DATE OCC"].agg(len).reset_index()
+    # observed=True keeps only the age groups that actually appear in each year
+    agegroup_num = df.groupby(["year","Vict Age Group"], observed=True)["DATE OCC"].agg(len).reset_index()
     agegroup_num.rename(columns = {"DATE OCC" : "Victim Count"}, inplace = True)
     
     # here we define the x and y axes of our plot and set a portion of each bar to a color
@@ -112,7 +116,9 @@ def crime_count_sex(year_begin,year_end):
     None.
 
     '''
-    df = cdb.query_years(year_begin, year_end)
+    from matplotlib import pyplot as plt
+    import seaborn as sns
+    df = cdb.query_years(year_begin, year_end, compact=True)
     
     # here we define the x-axis of our plot and set each bar to have a color corresponding to a victim sex
     sns.countplot(df, x="year", hue="Vict Sex").set(title=f"Crime Count by Victim Sex and Year, {year_begin}-{year_end}")
@@ -137,7 +143,8 @@ def crime_map(year_begin,year_end):
     None.
 
     '''
-    df = cdb.query_years(year_begin, year_end)
+    import plotly.express as px
+    df = cdb.query_years(year_begin, year_end, compact=True)
     # this gives us access to mapbox 
     px.set_mapbox_access_token("pk.eyJ1IjoiZ2pveWNlODA1IiwiYSI6ImNsbzF2cWYydzFsa24yaW82OGFiNDA3MDUifQ.gBGJPQQphfnWPWTaY4LqwA")
     
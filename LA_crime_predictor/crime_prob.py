@@ -6,9 +6,10 @@ Created on Sun Dec 10 23:54:07 2023
 """
 
 from LA_crime_predictor import crime_db as cdb
-from scipy.stats import poisson,expon
+from LA_crime_predictor import profiling as prof
 import numpy as np
-import matplotlib.pyplot as plt
+# scipy and matplotlib are imported inside the functions that need them, so computing
+# lambda does not pay for loading them
 
 
 def calc_lambda(address):
@@ -30,7 +31,24 @@ def calc_lambda(address):
 
     '''
     df = cdb.query_address(address)
-    num_crimes = df.agg(len)[0] # counts number of rows in the dataframe
+    return lambda_from_df(df)
+
+def lambda_from_df(df):
+    '''
+    Takes in the dataframe returned by query_address and calculates lambda for it.
+
+    Parameters
+    ----------
+    df : dataframe
+        crimes committed near an address over the last 2 complete years
+
+    Returns
+    -------
+    l : float
+        the average number of crimes occurring in the area per day
+
+    '''
+    num_crimes = len(df) # counts number of rows in the dataframe
     num_days = 2 * 365 
     # here we count the number of days in 2 years since our query only looks at 
     # the last 2 complete years
@@ -38,6 +56,52 @@ def calc_lambda(address):
     
     return l
 
+def poisson_curve(l):
+    '''
+    Takes in lambda and returns the x-values and Poisson probabilities used by plot_poisson.
+
+    Parameters
+    ----------
+    l : float
+        the average number of crimes occurring in the area per day
+
+    Returns
+    -------
+    (x, y) : (numpy array, numpy array)
+        number of crimes and the probability of observing that many crimes in a day
+
+    '''
+    from scipy.stats import poisson
+    x = np.arange(0, (10*l), 1) # since the poisson distribution is discrete, step size of 1 makes the most sense
+    with prof.span("compute"):
+        y = poisson.pmf(x, mu=l) # here we specify lambda as the mean of the Poisson distribution
+    # for sufficiently large λ, the poisson distribution approximates the normal distribution
+    return x, y
+
+def expon_curve(l):
+    '''
+    Takes in lambda and returns the x-values and exponential densities used by plot_expon.
+
+    Parameters
+    ----------
+    l : float
+        the average number of crimes occurring in the area per day
+
+    Returns
+    -------
+    (x, y) : (numpy array, numpy array)
+        days between crimes and the probability density of that waiting time
+
+    '''
+    from scipy.stats import expon
+    l_inverse = round(1/l,4)
+    # since the exponential distribution is continuous, we can use a much smaller step size
+    x = np.arange(0, 5, 0.01) 
+    # here we specify 1/lambda as the mean of the expoenetial distribution
+    with prof.span("compute"):
+        y = expon.pdf(x, 0, scale=(l_inverse)) 
+    return x, y
+
 def plot_poisson(address):
     '''
     Takes in an address as a string, calls the calc_lambda function with the address as
@@ -55,10 +119,9 @@ def plot_poisson(address):
     None.
 
     '''
+    import matplotlib.pyplot as plt
     l = calc_lambda(address)
-    x = np.arange(0, (10*l), 1) # since the poisson distribution is discrete, step size of 1 makes the most sense
-    y = poisson.pmf(x, mu=l) # here we specify lambda as the mean of the Poisson distribution
-    # for sufficiently large λ, the poisson distribution approximates the normal distribution
+    x, y = poisson_curve(l)
     
     plt.plot(x, y)
     plt.xlabel("# of Crimes Today")
@@ -84,12 +147,10 @@ def plot_expon(address):
     None.
 
     '''
+    import matplotlib.pyplot as plt
     l = calc_lambda(address)
     l_inverse = round(1/l,4)
-    # since the exponential distribution is continuous, we can use a much smaller step size
-    x = np.arange(0, 5, 0.01) 
-    # here we specify 1/lambda as the mean of the expoenetial distribution
-    y = expon.pdf(x, 0, scale=(l_inverse)) 
+    x, y = expon_curve(l)
     
     plt.plot(x, y)
     plt.xlabel("Days Between Crime Occurrences")
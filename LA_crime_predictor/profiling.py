@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""
+Opt-in instrumentation for the LA_crime_predictor package.
+
+Timing spans (geocode, query, decode, encode, fit, predict, compute) and SQLite query
+plans are only recorded while a profile() block is active, so the normal code
+path pays nothing more than a flag check. The active profile is kept in a context
+variable, so concurrent asyncio tasks and threads each record into their own block.
+"""
+
+# imports
+import json
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+#Global Variables
+_active = ContextVar("la_crime_profile", default=None) # the Profile collecting data, or None when disabled
+
+
+class Profile:
+    '''
+    Collects timing spans and query information while a profile() block is active.
+
+    Attributes
+    ----------
+    spans : dict
+        span name -> list of durations in seconds
+    queries : list
+        one dict per SQL query with the statement, its EXPLAIN QUERY PLAN,
+        the number of rows returned and the number of SQLite VM steps used
+    '''
+
+    def __init__(self):
+        self.spans = {}
+        self.queries = []
+
+    def add_span(self, name, seconds):
+        self.spans.setdefault(name, []).append(seconds)
+
+    def summary(self):
+        '''
+        Returns
+        -------
+        dict
+            span name -> {"count", "total", "max"} with times in seconds
+        '''
+        return {name: {"count": len(d), "total": sum(d), "max": max(d)}
+                for name, d in self.spans.items()}
+
+    def to_json(self):
+        '''
+        Returns
+        -------
+        str
+            the span summary and the recorded queries as a JSON document
+        '''
+        return json.dumps({"spans": self.summary(), "queries": self.queries}, indent=2)
+
+    def to_prometheus(self):
+        '''
+        Returns
+        -------
+        str
+            the span summary and query counters in the Prometheus text exposition format
+        '''
+        lines = ["# TYPE la_crime_span_seconds summary"]
+        for name, s in self.summary().items():
+            lines.append(f'la_crime_span_seconds_count{{span="{name}"}} {s["count"]}')
+            lines.append(f'la_crime_span_seconds_sum{{span="{name}"}} {s["total"]:.6f}')
+        lines.append("# TYPE la_crime_span_seconds_max gauge")
+        for name, s in self.summary().items():
+            lines.append(f'la_crime_span_seconds_max{{span="{name}"}} {s["max"]:.6f}')
+        lines.append("# TYPE la_crime_query_rows_total counter")
+        lines.append(f"la_crime_query_rows_total {sum(q['rows'] for q in self.queries)}")
+        lines.append("# TYPE la_crime_query_vm_steps_total counter")
+        lines.append(f"la_crime_query_vm_steps_total {sum(q['vm_steps'] for q in self.queries)}")
+        return "\n".join(lines) + "\n"
+
+
+@contextmanager
+def profile():
+    '''
+    Enables instrumentation for the duration of the with block and yields the
+    Profile that collects the data. Nested blocks share the outer Profile.
+
+    Example
+    -------
+    with profile() as p:
+        crime_prob.plot_poisson("UCLA")
+    print(p.to_prometheus())
+    '''
+    outer = _active.get()
+    p = outer if outer is not None else Profile()
+    token = _active.set(p)
+    try:
+        yield p
+    finally:
+        _active.reset(token)
+
+
+def enabled():
+    '''
+    Returns
+    -------
+    bool
+        True when a profile() block is active
+    '''
+    return _active.get() is not None
+
+
+@contextmanager
+def span(name):
+    '''
+    Times the with block and records it under the given span name if profiling is enabled.
+
+    Parameters
+    ----------
+    name : str
+        span name, one of "geocode", "query", "decode", "encode", "fit", "predict", "compute"
+    '''
+    p = _active.get()
+    if p is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        p.add_span(name, time.perf_counter() - start)
+
+
+def record_query(conn, cmd, rows, vm_steps):
+    '''
+    Records the EXPLAIN QUERY PLAN of a statement along with the rows it returned.
+
+    Parameters
+    ----------
+    conn : sqlite3.Connection
+        open connection the query was run on
+    cmd : str
+        SQL statement
+    rows : int
+        number of rows the query returned
+    vm_steps : int
+        approximate number of SQLite VM instructions spent running the query, a proxy
+        for the rows scanned (SQLite does not report scanned rows directly)
+    '''
+    p = _active.get()
+    if p is None:
+        return
+    plan = [row[-1] for row in conn.execute("EXPLAIN QUERY PLAN " + cmd).fetchall()]
+    p.queries.append({"sql": " ".join(cmd.split()), "plan": plan,
+                            "rows": rows, "vm_steps": vm_steps})
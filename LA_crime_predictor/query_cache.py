@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""
+Result cache for crime_db queries.
+
+Results are kept in an in-process LRU bounded by bytes and, optionally, in a
+directory of Parquet files. Every entry is tagged with the database's ingest
+generation, so anything cached before the database was rebuilt or appended to
+is never served again.
+"""
+
+# imports
+import hashlib
+import os
+import sqlite3
+import tempfile
+import threading
+from collections import OrderedDict
+
+#Global Variables
+max_bytes = 512 * 1024**2 # memory budget of the in-process tier
+disk_dir = None # directory for the Parquet tier, None disables it
+
+
+def configure(memory_bytes=None, directory=None):
+    '''
+    Changes the size of the in-process tier and/or turns on the on-disk tier.
+
+    Parameters
+    ----------
+    memory_bytes : int, optional
+        memory budget of the in-process tier in bytes, 0 disables it
+    directory : str, optional
+        directory to store Parquet files in; requires pyarrow (or fastparquet)
+    '''
+    global max_bytes, disk_dir
+    if memory_bytes is not None:
+        max_bytes = memory_bytes
+        with _lock:
+            _memory.trim()
+    if directory is not None:
+        os.makedirs(directory, exist_ok=True)
+        disk_dir = directory
+
+
+def generation(db_path):
+    '''
+    Takes in the path of the database and returns its ingest generation: the
+    user_version that create_db bumps on every ingest together with the file's
+    modification time and size, which also catches writes made outside create_db.
+
+    Parameters
+    ----------
+    db_path : str
+        path of the SQLite database
+
+    Returns
+    -------
+    tuple
+        value that changes whenever the contents of the database change
+    '''
+    try:
+        st = os.stat(db_path)
+    except FileNotFoundError:
+        return None
+    conn = sqlite3.connect(db_path)
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    conn.close()
+    return (version, st.st_mtime_ns, st.st_size)
+
+
+class _LRU:
+    '''
+    In-process tier: maps a query key to (generation, dataframe, size in bytes),
+    evicting the least recently used entries once max_bytes is exceeded.
+    '''
+
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.nbytes = 0
+
+    def get(self, key, gen):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] != gen: # the database changed since this was cached
+            self.pop(key)
+            return None
+        self.entries.move_to_end(key)
+        return entry[1]
+
+    def put(self, key, gen, df):
+        size = int(df.memory_usage(index=True, deep=True).sum())
+        self.pop(key)
+        if size > max_bytes:
+            return
+        self.entries[key] = (gen, df, size)
+        self.nbytes += size
+        self.trim()
+
+    def pop(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.nbytes -= entry[2]
+
+    def trim(self):
+        while self.nbytes > max_bytes and self.entries:
+            key = next(iter(self.entries))
+            self.pop(key)
+
+    def clear(self):
+        self.entries.clear()
+        self.nbytes = 0
+
+
+_memory = _LRU()
+_lock = threading.Lock() # queries may run on several threads (see crime_async)
+
+
+def _disk_path(key, gen):
+    name = hashlib.sha1(repr(key).encode()).hexdigest()
+    tag = hashlib.sha1(repr(gen).encode()).hexdigest()[:12]
+    return os.path.join(disk_dir, name), os.path.join(disk_dir, f"{name}-{tag}.parquet")
+
+
+def _disk_get(key, gen):
+    import pandas as pd
+    _, path = _disk_path(key, gen)
+    if not os.path.exists(path):
+        return None
+    try:
+        return pd.read_parquet(path)
+    except (OSError, ImportError): # unreadable file or no parquet engine, treat as a miss
+        return None
+
+
+def _disk_put(key, gen, df):
+    '''
+    Writes a result to the on-disk tier. Each writer uses its own temporary file, and
+    any failure only means the result is not stored on disk; the query itself succeeds.
+    '''
+    prefix, path = _disk_path(key, gen)
+    try:
+        # drop files written for older generations of the same query, leaving other
+        # writers' temporary files alone
+        for f in os.listdir(disk_dir):
+            old = os.path.join(disk_dir, f)
+            if old.startswith(prefix + "-") and old.endswith(".parquet") and old != path:
+                try:
+                    os.remove(old)
+                except FileNotFoundError: # already removed by another thread
+                    pass
+        fd, tmp = tempfile.mkstemp(dir=disk_dir, suffix=".tmp")
+        os.close(fd)
+    except OSError:
+        return
+    try:
+        df.to_parquet(tmp, index=False)
+        os.replace(tmp, path)
+    except (OSError, ImportError): # no parquet engine installed or disk error, keep the memory tier only
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+
+
+def cached_query(key, db_path, run_query):
+    '''
+    Returns the result for a query key, running the query only if no entry for the
+    current ingest generation of the database exists in either tier.
+
+    Parameters
+    ----------
+    key : tuple
+        normalized query (kind, year range, bounding box, columns)
+    db_path : str
+        path of the SQLite database the query reads from
+    run_query : function
+        called with no arguments to compute the result on a miss
+
+    Returns
+    -------
+    df
+        a copy of the cached result, so callers are free to modify it
+    '''
+    gen = generation(db_path)
+    with _lock:
+        df = _memory.get(key, gen)
+    if df is None and disk_dir is not None:
+        df = _disk_get(key, gen)
+        if df is not None:
+            with _lock:
+                _memory.put(key, gen, df)
+    if df is None:
+        df = run_query()
+        with _lock:
+            _memory.put(key, gen, df)
+        if disk_dir is not None:
+            _disk_put(key, gen, df)
+    return df.copy()
+
+
+def clear():
+    '''
+    Empties the in-process tier and removes every file in the on-disk tier.
+    '''
+    with _lock:
+        _memory.clear()
+    if disk_dir is not None:
+        for f in os.listdir(disk_dir):
+            if f.endswith(".parquet"):
+                os.remove(os.path.join(disk_dir, f))
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""
+Import-time budget for the LA_crime_predictor modules.
+
+Each module is imported in a fresh interpreter so nothing is already cached in
+sys.modules. Importing must stay well under a second and must not load any of the
+heavy plotting, statistics, geocoding or machine learning libraries, which the
+modules load on first use instead.
+"""
+
+# imports
+import json
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+pytest.importorskip("pandas") # crime_db needs pandas at import time
+
+#Global Variables
+repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+budget_seconds = 1.0
+heavy_modules = ["matplotlib", "scipy", "geopy", "seaborn", "plotly", "tensorflow", "sklearn"]
+
+child = """
+import json, sys
+import {module}
+print(json.dumps(sorted(name for name in {heavy!r} if name in sys.modules)))
+"""
+
+
+@pytest.mark.parametrize("module", ["LA_crime_predictor.crime_prob",
+                                    "LA_crime_predictor.crime_plots",
+                                    "LA_crime_predictor.ML",
+                                    "LA_crime_predictor.NN"])
+def test_import_is_fast_and_lazy(module):
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-c", child.format(module=module, heavy=heavy_modules)],
+                            cwd=repo_root, capture_output=True, text=True, check=True)
+    wall = time.perf_counter() - start
+    loaded = json.loads(result.stdout.strip().splitlines()[-1])
+
+    assert loaded == [], f"importing {module} loaded {loaded}"
+    # the whole short-lived process, interpreter start-up included, stays within budget
+    assert wall < budget_seconds, f"python -c 'import {module}' took {wall:.2f}s"